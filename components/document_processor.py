@@ -1,14 +1,166 @@
 # safety_standards_analyzer/components/document_processor.py
 
 import os
+import re
+import asyncio
+import threading
+import multiprocessing
 import PyPDF2
 import docx
 import uuid
 import json
+import hashlib
 import numpy as np
-from typing import List, Dict, Any, BinaryIO
-from openai import OpenAI
+from collections import Counter
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, BinaryIO, Optional, Tuple, Union
+from openai import OpenAI, AsyncOpenAI
 import pandas as pd
+from components.semantic_cache import SemanticCache
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_DIM = 1536
+# Maximum number of inputs sent in a single embeddings request
+EMBEDDING_BATCH_SIZE = 256
+# Maximum total characters sent in a single embeddings request. The endpoint
+# limits the tokens per request; at about 4 characters per token this stays
+# well below that limit even for text that tokenizes several times denser.
+EMBEDDING_BATCH_MAX_CHARS = 400_000
+# Maximum number of embeddings requests in flight at once
+EMBEDDING_MAX_CONCURRENCY = 8
+
+# Number of query embeddings kept in the in-process LRU cache
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+# Number of recent searches kept for reuse by near-duplicate queries
+RECENT_SEARCH_LIMIT = 128
+# Queries at least this similar to a recent query reuse its results
+QUERY_REUSE_THRESHOLD = 0.95
+
+# PDFs with at least this many pages are extracted in a process pool
+PDF_PARALLEL_MIN_PAGES = 16
+# Maximum number of processes shared by all PDF extractions
+PDF_MAX_WORKERS = 8
+
+# Lines that start a top-level section: "1. Introduction", "Section 3 Scope",
+# "Appendix A: References" or an ALL-CAPS heading. A heading number must be on
+# the same line as its title, so a page number above a running header is not one.
+HEADING_PATTERN = re.compile(
+    r"^(?:(?P<number>\d+)\.?[ \t]+[A-Z]|Section\s+\d+(?:\.\d+)*\b|Appendix\s+[A-Z]\b|[A-Z][A-Z0-9 ,&:/-]{5,}$)[^\n]{0,80}$",
+    re.MULTILINE
+)
+# Non-blank lines, and the item number a line starts with ("2. Gadgets", "3 Things")
+NON_BLANK_LINE_PATTERN = re.compile(r"^.*\S.*$", re.MULTILINE)
+NUMBERED_LINE_PATTERN = re.compile(r"[ \t]*(\d+)[.)]?[ \t]")
+
+def _embedding_cache_key(text: str) -> str:
+    """Return the embedding cache key for a text embedded with EMBEDDING_MODEL."""
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\0{text}".encode()).hexdigest()
+
+def _embedding_batches(texts: List[str]) -> List[List[str]]:
+    """Group texts into request batches within the input count and character limits."""
+    batches = []
+    batch, batch_chars = [], 0
+    for text in texts:
+        if batch and (len(batch) == EMBEDDING_BATCH_SIZE or batch_chars + len(text) > EMBEDDING_BATCH_MAX_CHARS):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(text)
+        batch_chars += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so that dot products equal cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+def _to_stored_precision(vectors) -> np.ndarray:
+    """
+    Normalize vectors and round them to the float16 precision used on disk,
+    so search scores are identical before and after the data is reloaded.
+    """
+    return _normalize_rows(np.asarray(vectors, dtype=np.float32)).astype(np.float16)
+
+def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Return the indices of the top_k highest scores, best first."""
+    top_k = min(top_k, len(scores))
+    top_indices = np.argpartition(-scores, top_k - 1)[:top_k]
+    return top_indices[np.argsort(-scores[top_indices])]
+
+def _extract_pdf_pages(source: Union[str, bytes], start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) from a PDF path or content (process pool worker)."""
+    from io import BytesIO
+    
+    reader = PyPDF2.PdfReader(source if isinstance(source, str) else BytesIO(source))
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the process pool shared by all PDF extractions, creating it on first use."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # Forking a multi-threaded server process is unsafe, so workers
+            # start from a fresh interpreter instead
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pdf_pool = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context(start_method))
+        return _pdf_pool
+
+def _reset_pdf_pool(pool: ProcessPoolExecutor) -> None:
+    """Discard a broken process pool so the next extraction starts a new one."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+def _file_path(file: BinaryIO) -> Optional[str]:
+    """Return the filesystem path backing a file object, or None for in-memory files."""
+    try:
+        file.fileno()
+    except (AttributeError, OSError):  # io.UnsupportedOperation is an OSError
+        return None
+    name = getattr(file, 'name', None)
+    return name if isinstance(name, str) and os.path.isfile(name) else None
+
+def _read_rows(path: str, dtype) -> np.ndarray:
+    """Read a raw append-only matrix file, dropping any partially written last row."""
+    values = np.fromfile(path, dtype=dtype)
+    rows = len(values) // EMBEDDING_DIM
+    return values[:rows * EMBEDDING_DIM].reshape(rows, EMBEDDING_DIM)
+
+def _read_jsonl(path: str) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Read an append-only JSON lines file, stopping at the first line that was
+    not completely written. Returns the records and whether the whole file
+    was read.
+    """
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.endswith("\n"):
+                return records, False
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                return records, False
+    return records, True
+
+def _write_file_atomic(path: str, mode: str, write) -> None:
+    """Write a file through a temporary copy, so it is never left half written."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
 
 class DocumentProcessor:
     """
@@ -21,10 +173,31 @@ class DocumentProcessor:
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.documents = []
         self.sections = []
-        self.embeddings = []  # Initialize as a list, not a NumPy array
+        self.embeddings = np.empty((0, EMBEDDING_DIM), dtype=np.float32)  # One row per section
+        self._doc_sections = {}  # document id -> indices of its sections
+        self._doc_by_id = {}  # document id -> document record
+        # Guards shared state when documents are processed from several threads
+        self._lock = threading.Lock()
         self.document_db_path = "data/documents.json"
-        self.sections_db_path = "data/sections.json"
-        self.embeddings_db_path = "data/embeddings.npy"
+        # Sections and embeddings are append-only: one JSON section per line and
+        # one raw float16 row per section, written in the same order
+        self.sections_db_path = "data/sections.jsonl"
+        self.embeddings_db_path = "data/embeddings.bin"
+        # Embedding cache: one sha256 key per line and one raw float16 row per key
+        self.embedding_cache_keys_path = "data/embedding_cache.keys"
+        self.embedding_cache_path = "data/embedding_cache.f16"
+        # Files written by earlier versions, migrated on first load
+        self.legacy_sections_db_path = "data/sections.json"
+        self.legacy_embeddings_db_path = "data/embeddings.npy"
+        self._saved_section_count = 0  # sections already written to disk
+        self._rewrite_pending = False  # append-only files must be rewritten on the next save
+        self._persist = True  # False when the files on disk could not be loaded
+        self._emb_cache = {}  # sha256(model, text) -> embedding vector
+        self._unsaved_cache_keys = []  # cache entries not written to disk yet
+        self._query_embedding = lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)(self._create_embedding)
+        # Recent searches, reused by near-duplicate queries
+        self._recent_searches = SemanticCache(EMBEDDING_DIM, threshold=QUERY_REUSE_THRESHOLD,
+                                              max_entries=RECENT_SEARCH_LIMIT)
         
         # Create data directory if it doesn't exist
         os.makedirs("data", exist_ok=True)
@@ -38,55 +211,169 @@ class DocumentProcessor:
             if os.path.exists(self.document_db_path):
                 with open(self.document_db_path, 'r') as f:
                     self.documents = json.load(f)
+                self._doc_by_id = {doc['id']: doc for doc in self.documents}
             
+            # Each store falls back to the file written by earlier versions, which
+            # also covers a migration interrupted between the two files
+            rewrite = False
+            sections_found = embeddings_found = True
             if os.path.exists(self.sections_db_path):
-                with open(self.sections_db_path, 'r') as f:
+                # An interrupted save can leave an incomplete last line
+                self.sections, complete = _read_jsonl(self.sections_db_path)
+                rewrite = not complete
+            elif os.path.exists(self.legacy_sections_db_path):
+                with open(self.legacy_sections_db_path, 'r') as f:
                     self.sections = json.load(f)
+                rewrite = True
+            else:
+                sections_found = False
             
             if os.path.exists(self.embeddings_db_path):
-                # Convert NumPy array to list when loading
-                embeddings_array = np.load(self.embeddings_db_path)
-                self.embeddings = embeddings_array.tolist()
+                embeddings = _read_rows(self.embeddings_db_path, np.float16)
+            elif os.path.exists(self.legacy_embeddings_db_path):
+                # Older files hold unnormalized float64 vectors
+                embeddings = _to_stored_precision(np.load(self.legacy_embeddings_db_path))
+                rewrite = True
+            else:
+                embeddings = np.empty((0, EMBEDDING_DIM), dtype=np.float16)
+                embeddings_found = False
+            self.embeddings = embeddings.astype(np.float32)
+            
+            # A missing store is not a partial save; trimming the other one to
+            # match would throw away everything it holds
+            if sections_found != embeddings_found and (len(self.sections) or len(self.embeddings)):
+                missing = self.embeddings_db_path if sections_found else self.sections_db_path
+                raise FileNotFoundError(f"{missing} is missing")
+            
+            # An interrupted save can also leave sections without embeddings or the reverse
+            count = min(len(self.sections), len(self.embeddings))
+            incomplete = {section['document_id'] for section in self.sections[count:]}
+            if count != len(self.sections) or count != len(self.embeddings):
+                self.sections = self.sections[:count]
+                self.embeddings = self.embeddings[:count]
+                rewrite = True
+            
+            # Documents that lost sections are dropped along with the sections they kept
+            loaded_counts = Counter(section['document_id'] for section in self.sections)
+            incomplete.update(doc['id'] for doc in self.documents
+                              if loaded_counts[doc['id']] < doc.get('section_count', 0))
+            if incomplete:
+                keep = np.array([section['document_id'] not in incomplete for section in self.sections], dtype=bool)
+                self.sections = [section for section, kept in zip(self.sections, keep) if kept]
+                self.embeddings = self.embeddings[keep] if len(keep) else self.embeddings
+                self.documents = [doc for doc in self.documents if doc['id'] not in incomplete]
+                self._doc_by_id = {doc['id']: doc for doc in self.documents}
+                rewrite = True
+            
+            for i, section in enumerate(self.sections):
+                self._doc_sections.setdefault(section['document_id'], []).append(i)
+            self._saved_section_count = len(self.sections)
+            
+            if os.path.exists(self.embedding_cache_keys_path) and os.path.exists(self.embedding_cache_path):
+                with open(self.embedding_cache_keys_path, 'r') as f:
+                    keys = f.read().split()
+                vectors = _read_rows(self.embedding_cache_path, np.float16).astype(np.float32)
+                self._emb_cache = dict(zip(keys, vectors))
+                rewrite = rewrite or len(keys) != len(vectors)
+            
+            if rewrite:
+                self._rewrite_data()
         except Exception as e:
-            print(f"Error loading data: {e}")
-            # Ensure embeddings is always a list
-            self.embeddings = []
+            print(f"Error loading data: {e}. New documents will not be saved.")
+            # Start empty, and never append to files that no longer match memory
+            self.documents = []
+            self.sections = []
+            self.embeddings = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+            self._doc_sections = {}
+            self._doc_by_id = {}
+            self._emb_cache = {}
+            self._persist = False
     
     def _save_data(self):
-        """Save document data to files."""
+        """
+        Save document data to files.
+        
+        Only sections, embeddings and cache entries added since the last save
+        are appended, so the cost of a save does not grow with the database.
+        If a save fails part way, the next one rewrites the files from memory.
+        """
+        if not self._persist:
+            return
         try:
-            with open(self.document_db_path, 'w') as f:
-                json.dump(self.documents, f)
+            _write_file_atomic(self.document_db_path, 'w', lambda f: json.dump(self.documents, f))
+            
+            if self._rewrite_pending:
+                # Each file is replaced whole, so rows on disk always line up
+                # with memory however many files were replaced before a crash
+                cache_keys = list(self._emb_cache)
+                cache_vectors = (np.stack([self._emb_cache[key] for key in cache_keys]) if cache_keys
+                                 else np.empty((0, EMBEDDING_DIM), dtype=np.float32))
+                _write_file_atomic(self.sections_db_path, 'w',
+                                   lambda f: f.writelines(json.dumps(section) + "\n" for section in self.sections))
+                _write_file_atomic(self.embeddings_db_path, 'wb',
+                                   lambda f: self.embeddings.astype(np.float16).tofile(f))
+                _write_file_atomic(self.embedding_cache_keys_path, 'w',
+                                   lambda f: f.writelines(key + "\n" for key in cache_keys))
+                _write_file_atomic(self.embedding_cache_path, 'wb',
+                                   lambda f: cache_vectors.astype(np.float16).tofile(f))
+                self._saved_section_count = len(self.sections)
+                self._unsaved_cache_keys = []
+                self._rewrite_pending = False
             
-            with open(self.sections_db_path, 'w') as f:
-                json.dump(self.sections, f)
+            new_sections = self.sections[self._saved_section_count:]
+            if new_sections:
+                with open(self.sections_db_path, 'a') as f:
+                    f.writelines(json.dumps(section) + "\n" for section in new_sections)
+                with open(self.embeddings_db_path, 'ab') as f:
+                    # Stored at half precision; widened back to float32 for search on load
+                    self.embeddings[self._saved_section_count:].astype(np.float16).tofile(f)
+                self._saved_section_count = len(self.sections)
             
-            if len(self.embeddings) > 0:
-                # Convert list to NumPy array when saving
-                embeddings_array = np.array(self.embeddings)
-                np.save(self.embeddings_db_path, embeddings_array)
+            if self._unsaved_cache_keys:
+                with open(self.embedding_cache_keys_path, 'a') as f:
+                    f.writelines(key + "\n" for key in self._unsaved_cache_keys)
+                with open(self.embedding_cache_path, 'ab') as f:
+                    vectors = np.stack([self._emb_cache[key] for key in self._unsaved_cache_keys])
+                    vectors.astype(np.float16).tofile(f)
+                self._unsaved_cache_keys = []
         except Exception as e:
             print(f"Error saving data: {e}")
+            # The files may now end part way through a row
+            self._rewrite_pending = True
     
-    def process_document(self, file: BinaryIO) -> None:
+    def _rewrite_data(self):
+        """Rewrite the append-only files from memory, after a migration or a partial save."""
+        self._rewrite_pending = True
+        self._save_data()
+    
+    def process_document(self, file: Union[BinaryIO, str], file_name: Optional[str] = None) -> None:
         """
         Process a document file, extract text, split into sections,
         and create embeddings.
         
         Args:
-            file: File object to process
+            file: File object or filesystem path to process
+            file_name: Name to record for the document; defaults to the file's name
         """
-        # Extract text based on file type
-        file_content = file.read()
-        file_name = file.name
+        if isinstance(file, str):
+            with open(file, 'rb') as f:
+                return self.process_document(f, file_name)
+        
+        file_name = file_name or file.name
         file_extension = os.path.splitext(file_name)[1].lower()
         
+        # Determine the size without reading the whole file into memory
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell()
+        file.seek(0)
+        
+        # Extract text based on file type; parsers read from the file directly
         if file_extension == '.pdf':
-            text = self._extract_text_from_pdf(file_content)
+            text = self._extract_text_from_pdf(file)
         elif file_extension == '.docx':
-            text = self._extract_text_from_docx(file_content)
+            text = self._extract_text_from_docx(file)
         elif file_extension == '.txt':
-            text = file_content.decode('utf-8')
+            text = file.read().decode('utf-8')
         else:
             raise ValueError(f"Unsupported file format: {file_extension}")
         
@@ -96,47 +383,69 @@ class DocumentProcessor:
             'id': doc_id,
             'filename': file_name,
             'type': file_extension[1:],  # Remove the dot
-            'size': len(file_content),
+            'size': file_size,
             'processed_date': pd.Timestamp.now().isoformat()
         }
-        self.documents.append(document)
         
-        # Split into sections
+        # Split into sections; the count lets a load spot sections lost to a partial save
         sections = self._split_into_sections(text, doc_id)
+        document['section_count'] = len(sections)
         
-        # Process each section
-        for section in sections:
-            # Create embedding for section
-            embedding = self._create_embedding(section['content'])
-            
-            # Add section to database
-            self.sections.append(section)
-            self.embeddings.append(embedding)  # This will work now because embeddings is a list
+        # Create embeddings for all sections in as few requests as possible
+        embeddings = self._create_embeddings_batch([section['content'] for section in sections])
         
-        # Save updated data
-        self._save_data()
+        # Add the document and its sections to the database in one step, so
+        # concurrent calls keep each document's sections contiguous
+        with self._lock:
+            self.documents.append(document)
+            self._doc_by_id[doc_id] = document
+            
+            first_index = len(self.sections)
+            self._doc_sections[doc_id] = list(range(first_index, first_index + len(sections)))
+            self.sections.extend(sections)
+            if embeddings:
+                self.embeddings = np.concatenate([self.embeddings, np.stack(embeddings)])
+            
+            # Earlier search results may no longer be the best matches
+            self._recent_searches.clear()
+            
+            # Save updated data
+            self._save_data()
     
-    def _extract_text_from_pdf(self, content: bytes) -> str:
-        """Extract text from PDF content."""
-        from io import BytesIO
-        
-        text = ""
-        with BytesIO(content) as file:
-            reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text() + "\n\n"
-        return text
+    def _extract_text_from_pdf(self, file: BinaryIO) -> str:
+        """Extract text from a PDF file object."""
+        reader = PyPDF2.PdfReader(file)
+        page_count = len(reader.pages)
+        workers = min(os.cpu_count() or 1, PDF_MAX_WORKERS)
+        if page_count < PDF_PARALLEL_MIN_PAGES or workers < 2:
+            return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+        
+        # Text extraction is CPU-bound pure Python, so large PDFs are split into
+        # contiguous page ranges and extracted in separate processes. Workers
+        # reopen the file by path when possible; in-memory uploads are sent as bytes.
+        # The pool is shared, so documents processed concurrently queue for the
+        # same workers instead of each starting their own.
+        source = _file_path(file)
+        if source is None:
+            file.seek(0)
+            source = file.read()
+        
+        step = -(-page_count // workers)
+        starts = list(range(0, page_count, step))
+        stops = [min(start + step, page_count) for start in starts]
+        pool = _get_pdf_pool(workers)
+        try:
+            page_ranges = pool.map(_extract_pdf_pages, [source] * len(starts), starts, stops)
+            return "\n\n".join(page_text for pages in page_ranges for page_text in pages)
+        except BrokenProcessPool:
+            # A worker died; start a new pool next time and extract this PDF here
+            _reset_pdf_pool(pool)
+            return "\n\n".join(page.extract_text() or "" for page in reader.pages)
     
-    def _extract_text_from_docx(self, content: bytes) -> str:
-        """Extract text from DOCX content."""
-        from io import BytesIO
-        
-        text = ""
-        with BytesIO(content) as file:
-            doc = docx.Document(file)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-        return text
+    def _extract_text_from_docx(self, file: BinaryIO) -> str:
+        """Extract text from a DOCX file object."""
+        doc = docx.Document(file)
+        return "\n".join(para.text for para in doc.paragraphs)
     
     
     def _split_into_sections(self, text: str, doc_id: str) -> List[Dict[str, Any]]:
@@ -144,18 +453,89 @@ class DocumentProcessor:
         Split document text into sections using a combination of rule-based
         approach and AI assistance.
         """
-        # Simple split by double newlines for sections (in a real app, this would be more sophisticated)
+        # Documents with recognizable headings are split locally; the LLM is
+        # only used when no usable heading structure is found
+        parsed_sections = self._split_by_heading_regex(text)
+        if not parsed_sections:
+            parsed_sections = self._split_with_llm(text)
+        
+        # Format sections with metadata
+        result = []
+        for i, section in enumerate(parsed_sections):
+            section_id = str(uuid.uuid4())
+            result.append({
+                'id': section_id,
+                'document_id': doc_id,
+                'index': i,
+                'title': section.get('title', f"Section {i+1}"),
+                'content': section.get('content', '').strip(),
+                'word_count': len(section.get('content', '').split())
+            })
+        
+        return result
+    
+    def _split_by_heading_regex(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Split document text on top-level headings.
+        
+        Returns an empty list when the headings do not give at least three
+        sections averaging more than 50 words, so the caller can fall back
+        to the LLM.
+        """
+        # Item number of each non-blank line, indexed by where the line starts
+        line_starts = {}
+        line_numbers = []
+        for line in NON_BLANK_LINE_PATTERN.finditer(text):
+            numbered = NUMBERED_LINE_PATTERN.match(line.group())
+            line_starts[line.start()] = len(line_numbers)
+            line_numbers.append(int(numbered.group(1)) if numbered else None)
+        
+        starts = []
+        last_number = 0
+        for match in HEADING_PATTERN.finditer(text):
+            if match.group("number"):
+                # A line next to the previous or following item number is part
+                # of a numbered list (or a table of contents), not a heading
+                number = int(match.group("number"))
+                i = line_starts[match.start()]
+                if ((i > 0 and line_numbers[i - 1] == number - 1) or
+                        (i + 1 < len(line_numbers) and line_numbers[i + 1] == number + 1)):
+                    continue
+                # Numbered headings must also continue the heading sequence
+                if number != last_number + 1:
+                    continue
+                last_number = number
+            starts.append(match.start())
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)  # Keep any preamble before the first heading
+        
+        sections = []
+        for start, end in zip(starts, starts[1:] + [len(text)]):
+            content = text[start:end].strip()
+            if content:
+                sections.append({"title": content.split("\n", 1)[0].strip(), "content": content})
+        
+        word_counts = [len(section["content"].split()) for section in sections]
+        if len(sections) < 3 or sum(word_counts) / len(sections) <= 50:
+            return []
+        return sections
+    
+    def _split_with_llm(self, text: str) -> List[Dict[str, Any]]:
+        """Split document text into titled sections with the help of the LLM."""
+        # Simple split by double newlines for sections
         sections_text = text.split("\n\n")
+        paragraphs = "\n\n---\n\n".join(s.strip() for s in sections_text if s.strip())
         
         # Use OpenAI to identify proper section titles and organize content
         prompt = f"""
         I have a safety standards document that I need to split into proper sections. 
-        Here's the raw text split by paragraph breaks:
+        Here's the raw text, with paragraph breaks marked by "---":
         
-        {sections_text[:10]}  # Just sending first 10 paragraphs for brevity
+        {paragraphs}
         
-        Please identify the main sections and their titles. Return as a JSON list where each 
-        item has 'title' and 'content' keys. Merge paragraphs that belong to the same section.
+        Please identify the main sections and their titles. Return a JSON object with a "sections" 
+        key containing a list where each item has 'title' and 'content' keys. Merge paragraphs 
+        that belong to the same section.
         """
         
         response = self.client.chat.completions.create(
@@ -175,28 +555,88 @@ class DocumentProcessor:
             parsed_sections = [{"title": f"Section {i+1}", "content": s} 
                               for i, s in enumerate(sections_text) if s.strip()]
         
-        # Format sections with metadata
-        result = []
-        for i, section in enumerate(parsed_sections):
-            section_id = str(uuid.uuid4())
-            result.append({
-                'id': section_id,
-                'document_id': doc_id,
-                'index': i,
-                'title': section.get('title', f"Section {i+1}"),
-                'content': section.get('content', '').strip(),
-                'word_count': len(section.get('content', '').split())
-            })
+        return parsed_sections
+    
+    def embed_text(self, text: str) -> np.ndarray:
+        """
+        Get the unit-length embedding of a text, using the embedding caches.
         
-        return result
+        Args:
+            text: Text to embed
+            
+        Returns:
+            Normalized embedding vector
+        """
+        return self._query_embedding(text)
     
-    def _create_embedding(self, text: str) -> List[float]:
+    def _create_embedding(self, text: str) -> np.ndarray:
         """Create an embedding vector for the provided text."""
+        return self._create_embeddings_batch([text])[0]
+    
+    def _create_embeddings_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Create embedding vectors for many texts, batching the API requests.
+        
+        Texts that were embedded before are served from the embedding cache;
+        only the remaining unique texts are sent to the API.
+        """
+        texts = [text[:8000] for text in texts]  # Limit to first 8000 chars due to token limits
+        keys = [_embedding_cache_key(text) for text in texts]
+        
+        # Collect unique texts that are not cached yet
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._emb_cache and key not in missing:
+                missing[key] = text
+        
+        batches = _embedding_batches(list(missing.values()))
+        
+        if len(batches) <= 1:
+            batch_results = [self._embed_batch(batch) for batch in batches]
+        else:
+            # Issue the batches concurrently rather than one after another
+            batch_results = asyncio.run(self._aembed_batches(batches))
+        
+        # Vectors are stored unit-length, so cosine similarity is a plain dot product
+        new_embeddings = [embedding for batch in batch_results for embedding in batch]
+        if new_embeddings:
+            new_embeddings = _to_stored_precision(new_embeddings).astype(np.float32)
+        with self._lock:
+            for key, embedding in zip(missing, new_embeddings):
+                # Another thread may have embedded the same text meanwhile
+                if key not in self._emb_cache:
+                    self._emb_cache[key] = embedding
+                    self._unsaved_cache_keys.append(key)
+        
+        return [self._emb_cache[key] for key in keys]
+    
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed a single batch of texts with one API request."""
         response = self.client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text[:8000]  # Limit to first 8000 chars due to token limits
+            model=EMBEDDING_MODEL,
+            input=batch
         )
-        return response.data[0].embedding
+        # Results are returned in input order
+        return [d.embedding for d in response.data]
+    
+    async def _aembed_batches(self, batches: List[List[str]]) -> List[List[List[float]]]:
+        """Embed several batches concurrently, returning results in batch order."""
+        semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)
+        
+        # The async client is tied to the event loop it runs on, so it is
+        # created per call rather than stored on the instance
+        async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) as client:
+            async def embed(index: int, batch: List[str]):
+                async with semaphore:
+                    response = await client.embeddings.create(
+                        model=EMBEDDING_MODEL,
+                        input=batch
+                    )
+                return index, [d.embedding for d in response.data]
+            
+            results = await asyncio.gather(*(embed(i, batch) for i, batch in enumerate(batches)))
+        
+        return [embeddings for _, embeddings in sorted(results, key=lambda result: result[0])]
     
     def search_standards(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """
@@ -209,29 +649,34 @@ class DocumentProcessor:
         Returns:
             List of relevant sections with metadata
         """
-        # Create embedding for query
-        query_embedding = self._create_embedding(query)
+        # Score against the current matrix even if a document is added meanwhile;
+        # its row count identifies the database the results belong to
+        embeddings = self.embeddings
+        section_count = len(embeddings)
         
         # If no embeddings exist yet, return empty list
-        if len(self.embeddings) == 0:
+        if section_count == 0:
             return []
         
-        # Convert list to numpy array for efficient computation
-        embeddings_array = np.array(self.embeddings)
+        # Create embedding for query
+        query_embedding = self._query_embedding(query)
         
-        # Calculate cosine similarity
-        similarities = np.dot(embeddings_array, query_embedding) / (
-            np.linalg.norm(embeddings_array, axis=1) * np.linalg.norm(query_embedding)
-        )
+        # Reuse the results of a recent near-duplicate query
+        results = self._find_recent_search(query_embedding, top_k, section_count)
+        if results is not None:
+            return results
         
-        # Get indices of top k results
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        # Embeddings are unit-length, so cosine similarity is a single matrix-vector product
+        similarities = embeddings @ query_embedding
+        
+        # Get indices of top k results without sorting every similarity
+        top_indices = _top_k_indices(similarities, top_k)
         
         # Collect results
         results = []
         for idx in top_indices:
             section = self.sections[idx]
-            document = next((d for d in self.documents if d['id'] == section['document_id']), {})
+            document = self._doc_by_id.get(section['document_id'], {})
             
             results.append({
                 'id': section['id'],
@@ -242,8 +687,30 @@ class DocumentProcessor:
                 'title': section['title']
             })
         
+        self._remember_search(query_embedding, top_k, section_count, results)
         return results
     
+    def _find_recent_search(self, query_embedding: np.ndarray, top_k: int,
+                            section_count: int) -> Optional[List[Dict[str, Any]]]:
+        """Return the results of a recent near-duplicate query on the same database, if there is one."""
+        with self._lock:
+            recent = self._recent_searches.get(query_embedding)
+        if recent is None:
+            return None
+        
+        # A search that was running while a document was added can be stored
+        # after the cache is cleared, so results are checked against the database
+        recent_count, recent_top_k, recent_results = recent
+        if recent_count != section_count or recent_top_k < top_k:
+            return None
+        return recent_results[:top_k]
+    
+    def _remember_search(self, query_embedding: np.ndarray, top_k: int, section_count: int,
+                         results: List[Dict[str, Any]]) -> None:
+        """Keep a search result for reuse by later near-duplicate queries."""
+        with self._lock:
+            self._recent_searches.put(query_embedding, (section_count, top_k, results))
+    
     def get_document_count(self) -> int:
         """Get the number of processed documents."""
         return len(self.documents)
@@ -274,31 +741,29 @@ class DocumentProcessor:
         # Calculate document-level embeddings by averaging section embeddings
         doc_embeddings = {}
         for doc_id in doc_ids:
-            doc_sections = [i for i, s in enumerate(self.sections) if s["document_id"] == doc_id]
+            doc_sections = self._doc_sections.get(doc_id)
             if doc_sections:
-                doc_embedding = np.mean([self.embeddings[i] for i in doc_sections], axis=0)
-                doc_embeddings[doc_id] = doc_embedding
+                # A document's sections are appended together, so its rows are
+                # normally a contiguous block that can be averaged as a view
+                if doc_sections[-1] - doc_sections[0] + 1 == len(doc_sections):
+                    rows = self.embeddings[doc_sections[0]:doc_sections[-1] + 1]
+                else:
+                    rows = self.embeddings[doc_sections]
+                doc_embeddings[doc_id] = rows.mean(axis=0, dtype=np.float32)
         
-        # Create edges between similar documents
-        for i, doc1_id in enumerate(doc_ids):
-            if doc1_id not in doc_embeddings:
-                continue
-                
-            for j, doc2_id in enumerate(doc_ids[i+1:], i+1):
-                if doc2_id not in doc_embeddings:
-                    continue
-                    
-                # Calculate similarity
-                similarity = np.dot(doc_embeddings[doc1_id], doc_embeddings[doc2_id]) / (
-                    np.linalg.norm(doc_embeddings[doc1_id]) * np.linalg.norm(doc_embeddings[doc2_id])
-                )
-                
-                # Add edge if similarity is above threshold
-                if similarity > 0.8:  # Arbitrary threshold
-                    edges.append({
-                        "source": doc1_id,
-                        "target": doc2_id,
-                        "weight": float(similarity)
-                    })
+        # Compare every pair of documents with a single matrix product
+        if doc_embeddings:
+            embedded_ids = list(doc_embeddings)
+            doc_matrix = _normalize_rows(np.stack([doc_embeddings[doc_id] for doc_id in embedded_ids]))
+            similarities = doc_matrix @ doc_matrix.T
+            
+            # Add an edge for each pair above the similarity threshold
+            rows, cols = np.where(np.triu(similarities > 0.8, k=1))  # Arbitrary threshold
+            for i, j in zip(rows, cols):
+                edges.append({
+                    "source": embedded_ids[i],
+                    "target": embedded_ids[j],
+                    "weight": float(similarities[i, j])
+                })
         
         return {"nodes": nodes, "edges": edges}
\ No newline at end of file
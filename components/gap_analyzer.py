@@ -1,6 +1,7 @@
 # safety_standards_analyzer/components/gap_analyzer.py
 
 import os
+import json
 from typing import List, Dict, Any
 from openai import OpenAI
 
@@ -26,11 +27,35 @@ class GapAnalyzer:
         Returns:
             List of identified gaps with metadata
         """
-        # First, search for related standards in our database
-        related_standards_results = doc_processor.search_standards(
-            f"safety standards for {domain}", top_k=5
-        )
+        related_standards_results = self.find_related_standards(domain, doc_processor)
+        return self.analyze_gaps_against_standards(research_text, domain, related_standards_results)
+    
+    def find_related_standards(self, domain: str, doc_processor) -> List[Dict[str, Any]]:
+        """
+        Retrieve the standards sections most related to a technology domain.
         
+        Args:
+            domain: Technology domain to focus on
+            doc_processor: DocumentProcessor instance for searching standards
+            
+        Returns:
+            Up to five search results, best match first
+        """
+        return doc_processor.search_standards(f"safety standards for {domain}", top_k=5)
+    
+    def analyze_gaps_against_standards(self, research_text: str, domain: str,
+                                       related_standards_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Ask the LLM for gaps between a research text and the related standards.
+        
+        Args:
+            research_text: Text from research papers or incident reports
+            domain: Technology domain to focus on
+            related_standards_results: Search results from find_related_standards
+            
+        Returns:
+            List of identified gaps with metadata
+        """
         # Extract relevant information from search results
         related_standards = []
         related_standards_content = ""
@@ -75,7 +100,7 @@ class GapAnalyzer:
         
         # Parse the response
         try:
-            gaps = eval(response.choices[0].message.content)["gaps"]
+            gaps = json.loads(response.choices[0].message.content)["gaps"]
             
             # Ensure consistent structure and add domain to each gap
             for gap in gaps:
@@ -89,7 +114,7 @@ class GapAnalyzer:
                     gap["risk_level"] = "Medium"
             
             return gaps
-        except:
+        except (json.JSONDecodeError, KeyError, TypeError):
             # Return a default structure if response parsing fails
             return [{
                 "title": f"Potential {domain} Safety Gap",
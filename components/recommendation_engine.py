@@ -1,6 +1,7 @@
 # safety_standards_analyzer/components/recommendation_engine.py
 
 import os
+import json
 from typing import List, Dict, Any
 from openai import OpenAI
 
@@ -62,7 +63,7 @@ class RecommendationEngine:
         
         # Parse the response
         try:
-            recommendations = eval(response.choices[0].message.content)["recommendations"]
+            recommendations = json.loads(response.choices[0].message.content)["recommendations"]
             
             # Ensure consistent structure
             for rec in recommendations:
@@ -76,7 +77,7 @@ class RecommendationEngine:
                         rec[field] = f"No {field} provided"
             
             return recommendations
-        except:
+        except (json.JSONDecodeError, KeyError, TypeError):
             # Return a default structure if response parsing fails
             return [{
                 "title": f"Address {gap['title']}",
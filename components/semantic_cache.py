@@ -0,0 +1,99 @@
+# safety_standards_analyzer/components/semantic_cache.py
+
+import time
+import numpy as np
+from typing import Any, Optional
+
+class SemanticCache:
+    """
+    Caches values keyed by unit-length embedding vectors. A lookup returns the
+    value of the most similar stored key when their cosine similarity reaches
+    the threshold, so near-duplicate queries share one result.
+    """
+    
+    def __init__(self, dim: int, threshold: float = 0.95, max_entries: int = 128,
+                 ttl: Optional[float] = None):
+        """
+        Initialize an empty cache.
+        
+        Args:
+            dim: Dimension of the embedding vectors
+            threshold: Minimum cosine similarity for a cache hit
+            max_entries: Number of entries kept before evicting the least recently used
+            ttl: Seconds an entry stays valid, or None to keep entries until evicted
+        """
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clear()
+    
+    def get(self, embedding: np.ndarray) -> Optional[Any]:
+        """Return the value stored under the most similar key, or None on a miss."""
+        self._expire()
+        if not self._values:
+            return None
+        
+        # Keys are unit-length, so one matrix-vector product gives all similarities
+        similarities = self._keys @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        
+        self._last_used[best] = time.monotonic()
+        return self._values[best]
+    
+    def put(self, embedding: np.ndarray, value: Any) -> None:
+        """
+        Store a value under an embedding. An entry whose key would match the
+        embedding is replaced, so a stale value cannot shadow the new one;
+        otherwise the least recently used entry is evicted if the cache is full.
+        """
+        self._expire()
+        now = time.monotonic()
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if self._values:
+            similarities = self._keys @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                self._keys[best] = embedding
+                self._values[best] = value
+                self._created[best] = now
+                self._last_used[best] = now
+                return
+        
+        if len(self._values) >= self.max_entries:
+            self._remove([int(np.argmin(self._last_used))])
+        
+        self._keys = np.vstack([self._keys, embedding])
+        self._values.append(value)
+        self._created.append(now)
+        self._last_used.append(now)
+    
+    def clear(self) -> None:
+        """Remove all entries."""
+        self._keys = np.empty((0, self.dim), dtype=np.float32)
+        self._values = []
+        self._created = []
+        self._last_used = []
+    
+    def __len__(self) -> int:
+        return len(self._values)
+    
+    def _expire(self) -> None:
+        """Remove entries older than the TTL."""
+        if self.ttl is None:
+            return
+        cutoff = time.monotonic() - self.ttl
+        self._remove([i for i, created in enumerate(self._created) if created < cutoff])
+    
+    def _remove(self, indices) -> None:
+        """Remove the entries at the given indices."""
+        if not indices:
+            return
+        removed = set(indices)
+        keep = [i for i in range(len(self._values)) if i not in removed]
+        self._keys = self._keys[keep]
+        self._values = [self._values[i] for i in keep]
+        self._created = [self._created[i] for i in keep]
+        self._last_used = [self._last_used[i] for i in keep]
@@ -22,11 +22,12 @@ def create_gap_visualization(gaps: List[Dict[str, Any]]):
     # Create data structure for visualization
     data = np.zeros((len(domains), len(risk_levels)))
     
-    # Populate data
-    for gap in gaps:
-        domain_idx = domains.index(gap["domain"])
-        risk_idx = risk_levels.index(gap["risk_level"])
-        data[domain_idx, risk_idx] += 1
+    # Populate data using index lookups instead of list searches
+    domain_index = {domain: i for i, domain in enumerate(domains)}
+    risk_index = {risk: i for i, risk in enumerate(risk_levels)}
+    domain_idx = np.array([domain_index[gap["domain"]] for gap in gaps], dtype=int)
+    risk_idx = np.array([risk_index[gap["risk_level"]] for gap in gaps], dtype=int)
+    np.add.at(data, (domain_idx, risk_idx), 1)
     
     # Create figure
     fig, ax = plt.subplots(figsize=(10, 6))
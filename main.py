@@ -1,23 +1,142 @@
 # safety_standards_analyzer/
 # main.py - Entry point for the application
 
+import hashlib
+import io
 import os
+import shutil
+import tempfile
+import time
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from components.document_processor import DocumentProcessor
-from components.gap_analyzer import GapAnalyzer
-from components.recommendation_engine import RecommendationEngine
-from components.visualization import create_gap_visualization, create_standards_network
 
-# Load environment variables
-load_dotenv()
+# The component modules pull in OpenAI, NumPy, PDF parsers and matplotlib, so
+# they are imported where they are first used and only the active page pays
+# for its own dependencies
+
+# Upload progress is redrawn once it advances by this fraction, and the status
+# text at most once per interval in seconds
+PROGRESS_UPDATE_STEP = 0.01
+STATUS_UPDATE_INTERVAL = 0.25
+
+# Position of each risk level in the dashboard tally
+RISK_IDX = {'High': 0, 'Medium': 1, 'Low': 2}
+
+# Gap analyses are reused for near-duplicate research texts for up to an hour
+GAP_CACHE_TTL = 3600
+
+# Load environment variables once per session rather than on every rerun
+if 'env_loaded' not in st.session_state:
+    load_dotenv()
+    st.session_state['env_loaded'] = True
 
 # Check if API key is set
 if not os.getenv("OPENAI_API_KEY"):
     st.error("OpenAI API key not found. Please set it in your .env file.")
     st.stop()
 
+# Components are created once per server process and reused across reruns
+@st.cache_resource
+def get_doc_processor():
+    from components.document_processor import DocumentProcessor
+    return DocumentProcessor()
+
+@st.cache_resource
+def get_gap_analyzer():
+    from components.gap_analyzer import GapAnalyzer
+    return GapAnalyzer()
+
+@st.cache_resource
+def get_recommendation_engine():
+    from components.recommendation_engine import RecommendationEngine
+    return RecommendationEngine()
+
+# Exact-match result caches shared across sessions. The section count ties
+# results to the standards database they were computed against; leading
+# underscores keep Streamlit from hashing the component arguments.
+@st.cache_data(ttl=300, max_entries=256)
+def cached_search(query, section_count, _doc_processor):
+    return _doc_processor.search_standards(query)
+
+@st.cache_data(ttl=300, max_entries=256)
+def cached_related_standards(domain, section_count, _gap_analyzer, _doc_processor):
+    return _gap_analyzer.find_related_standards(domain, _doc_processor)
+
+@st.cache_data(ttl=300, max_entries=256)
+def cached_gap_llm_analysis(research_text, domain, related_standards, _gap_analyzer):
+    return _gap_analyzer.analyze_gaps_against_standards(research_text, domain, related_standards)
+
+@st.cache_data(ttl=300, max_entries=256)
+def cached_recommendations(gap, _recommendation_engine):
+    return _recommendation_engine.generate_recommendations(gap)
+
+# Rendered charts are cached as PNG bytes so reruns skip matplotlib entirely
+def figure_to_png(fig):
+    import matplotlib.pyplot as plt
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=200, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+@st.cache_data(max_entries=64)
+def render_gap_visualization(gap_key):
+    from components.visualization import create_gap_visualization
+    # The heatmap only depends on each gap's domain and risk level
+    gaps = [{"domain": domain, "risk_level": risk_level} for domain, risk_level in gap_key]
+    return figure_to_png(create_gap_visualization(gaps))
+
+# The network only changes when documents are added, so the document and
+# section counts stand in for the network data and the similarity matrix and
+# spring layout are skipped entirely on a hit
+@st.cache_data(max_entries=64)
+def render_standards_network(document_count, section_count, _doc_processor):
+    from components.visualization import create_standards_network
+    network_data = _doc_processor.get_standards_network()
+    return figure_to_png(create_standards_network(network_data))
+
+def process_upload(doc_processor, file):
+    # Spool the upload to a temporary file in 1 MiB chunks so the document is
+    # parsed from disk, then remove the copy once it has been processed
+    file.seek(0)
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.name)[1])
+    try:
+        with tmp:
+            shutil.copyfileobj(file, tmp, length=1 << 20)
+        doc_processor.process_document(tmp.name, file_name=file.name)
+    finally:
+        os.remove(tmp.name)
+
+def analyze_gaps(gap_analyzer, doc_processor, research_text, domain, status):
+    from components.document_processor import EMBEDDING_DIM
+    from components.semantic_cache import SemanticCache
+    
+    # Near-duplicate research texts in the same domain reuse earlier results
+    gap_caches = st.session_state.setdefault('gap_cache', {})
+    if domain not in gap_caches:
+        gap_caches[domain] = SemanticCache(EMBEDDING_DIM, ttl=GAP_CACHE_TTL)
+    cache = gap_caches[domain]
+    
+    # Results are only valid for the standards database they were computed against
+    section_count = doc_processor.get_section_count()
+    status.update(label="Embedding research text...")
+    embedding = doc_processor.embed_text(research_text)
+    cached = cache.get(embedding)
+    if cached is not None and cached[0] == section_count:
+        return cached[1]
+    
+    # Each stage is cached separately; retrieval only depends on the domain,
+    # so new research texts in the same domain reuse it
+    status.update(label="Retrieving related standards...")
+    related_standards = cached_related_standards(domain, section_count, gap_analyzer, doc_processor)
+    status.update(label="Identifying gaps...")
+    gaps = cached_gap_llm_analysis(research_text, domain, related_standards, gap_analyzer)
+    cache.put(embedding, (section_count, gaps))
+    return gaps
+
 def main():
+    # Streamlit only keeps elements that are drawn during the current run, so
+    # the page config, title and sidebar are redrawn on every rerun
     st.set_page_config(page_title="Safety Standards Analyzer", layout="wide")
     
     st.title("AI-Powered Safety Standards Analyzer")
@@ -26,25 +145,22 @@ def main():
     recommendations for standards updates based on current safety research and emerging technologies.
     """)
     
-    # Sidebar navigation
+    # Sidebar navigation; the selection lives in session state under 'page'
     st.sidebar.title("Navigation")
-    page = st.sidebar.radio("Select a page:", 
-                           ["Document Processing", "Gap Analysis", "Recommendations", "Dashboard"])
+    st.sidebar.radio("Select a page:", 
+                     ["Document Processing", "Gap Analysis", "Recommendations", "Dashboard"],
+                     key='page')
+    page = st.session_state['page']
     
-    # Initialize components
-    doc_processor = DocumentProcessor()
-    gap_analyzer = GapAnalyzer()
-    recommendation_engine = RecommendationEngine()
-    
-    # Route to appropriate page
+    # Route to appropriate page, creating only the components it uses
     if page == "Document Processing":
-        show_document_processing(doc_processor)
+        show_document_processing(get_doc_processor())
     elif page == "Gap Analysis":
-        show_gap_analysis(gap_analyzer, doc_processor)
+        show_gap_analysis(get_gap_analyzer(), get_doc_processor())
     elif page == "Recommendations":
-        show_recommendations(recommendation_engine, gap_analyzer)
+        show_recommendations(get_recommendation_engine(), get_gap_analyzer())
     elif page == "Dashboard":
-        show_dashboard(doc_processor, gap_analyzer, recommendation_engine)
+        show_dashboard(get_doc_processor(), get_gap_analyzer(), get_recommendation_engine())
 
 def show_document_processing(doc_processor):
     st.header("Document Processing")
@@ -59,13 +175,56 @@ def show_document_processing(doc_processor):
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            for i, file in enumerate(uploaded_files):
-                status_text.text(f"Processing {file.name}...")
-                doc_processor.process_document(file)
-                progress_bar.progress((i + 1) / len(uploaded_files))
+            # Skip files whose contents were already processed in this session
+            processed_hashes = st.session_state.setdefault('processed_hashes', set())
+            new_files = {}
+            for file in uploaded_files:
+                file_hash = hashlib.sha256(file.getvalue()).hexdigest()
+                if file_hash not in processed_hashes:
+                    new_files.setdefault(file_hash, file)
+            
+            # Documents are processed concurrently; most of the time is spent
+            # waiting on file parsing and the OpenAI API
+            failures = []
+            if new_files:
+                status_text.text(f"Processing {len(new_files)} documents...")
+                with ThreadPoolExecutor(max_workers=min(8, len(new_files))) as executor:
+                    futures = {executor.submit(process_upload, doc_processor, file): file_hash
+                               for file_hash, file in new_files.items()}
+                    # Throttle redraws, since each one is a round trip to the browser
+                    last_fraction = 0.0
+                    last_status = time.monotonic()
+                    for i, future in enumerate(as_completed(futures)):
+                        # Record every document that made it into the database
+                        # before reporting failures, so a retry only repeats those
+                        file_name = new_files[futures[future]].name
+                        error = future.exception()
+                        if error is not None:
+                            failures.append((file_name, error))
+                            continue
+                        processed_hashes.add(futures[future])
+                        now = time.monotonic()
+                        if now - last_status >= STATUS_UPDATE_INTERVAL:
+                            status_text.text(f"Processed {file_name}")
+                            last_status = now
+                        fraction = (i + 1) / len(futures)
+                        if fraction - last_fraction >= PROGRESS_UPDATE_STEP:
+                            progress_bar.progress(fraction)
+                            last_fraction = fraction
+            progress_bar.progress(1.0)
             
-            status_text.text("All documents processed successfully!")
-            st.session_state['documents_processed'] = True
+            for file_name, error in failures:
+                st.error(f"Failed to process {file_name}: {error}")
+            if failures:
+                message = f"Processed {len(new_files) - len(failures)} of {len(new_files)} documents."
+            else:
+                message = "All documents processed successfully!"
+            skipped = len(uploaded_files) - len(new_files)
+            if skipped:
+                message += f" Skipped {skipped} already processed."
+            status_text.text(message)
+            if len(failures) < len(new_files) or not new_files:
+                st.session_state['documents_processed'] = True
     
     if st.session_state.get('documents_processed', False):
         st.subheader("Document Database")
@@ -73,16 +232,29 @@ def show_document_processing(doc_processor):
         st.write(f"Total sections: {doc_processor.get_section_count()}")
         
         st.subheader("Search Standards")
-        search_query = st.text_input("Enter search terms")
+        # The query only updates when the form is submitted, not on every keystroke
+        with st.form("search_form", clear_on_submit=False):
+            search_query = st.text_input("Enter search terms")
+            st.form_submit_button("Search")
         if search_query:
-            results = doc_processor.search_standards(search_query)
+            results = cached_search(search_query, doc_processor.get_section_count(), doc_processor)
             st.write(f"Found {len(results)} relevant sections")
-            for i, result in enumerate(results):
-                with st.expander(f"Result {i+1}: {result['title']}"):
-                    st.write(f"**Document**: {result['document']}")
-                    st.write(f"**Section**: {result['section']}")
-                    st.write(f"**Content**: {result['content']}")
-                    st.write(f"**Relevance Score**: {result['score']:.2f}")
+            if results:
+                import pandas as pd
+                
+                # One virtualized table instead of an expander per result
+                results_table = pd.DataFrame(results, columns=['title', 'document', 'section', 'score'])
+                results_table.index = pd.RangeIndex(1, len(results) + 1, name="Result")
+                st.dataframe(results_table,
+                             column_config={"score": st.column_config.NumberColumn("Relevance Score", format="%.2f")})
+                
+                selected = st.selectbox("Show result", range(len(results)),
+                                        format_func=lambda i: f"Result {i+1}: {results[i]['title']}")
+                result = results[selected]
+                st.write(f"**Document**: {result['document']}")
+                st.write(f"**Section**: {result['section']}")
+                st.write(f"**Content**: {result['content']}")
+                st.write(f"**Relevance Score**: {result['score']:.2f}")
 
 def show_gap_analysis(gap_analyzer, doc_processor):
     st.header("Gap Analysis")
@@ -103,12 +275,14 @@ def show_gap_analysis(gap_analyzer, doc_processor):
         tech_domain = st.text_input("Specify the technology domain")
     
     if st.button("Analyze Gaps") and research_text:
-        with st.spinner("Analyzing potential standard gaps..."):
-            # Perform gap analysis
-            gaps = gap_analyzer.identify_gaps(research_text, tech_domain, doc_processor)
+        with st.status("Analyzing potential standard gaps...", expanded=True) as status:
+            # Perform gap analysis, reporting each stage as it starts
+            gaps = analyze_gaps(gap_analyzer, doc_processor, research_text, tech_domain, status)
             
-            # Store results in session state
+            # Store results in session state along with the selectbox labels
             st.session_state['gap_analysis'] = gaps
+            st.session_state['gap_titles'] = tuple(f"Gap {i+1}: {gap['title']}" for i, gap in enumerate(gaps))
+            status.update(label="Gap analysis complete", state="complete", expanded=False)
     
     # Display previous gap analysis results if available
     if 'gap_analysis' in st.session_state:
@@ -125,8 +299,8 @@ def show_gap_analysis(gap_analyzer, doc_processor):
         
         # Visualization
         st.subheader("Gap Visualization")
-        fig = create_gap_visualization(gaps)
-        st.pyplot(fig)
+        gap_key = tuple((gap['domain'], gap['risk_level']) for gap in gaps)
+        st.image(render_gap_visualization(gap_key))
 
 def show_recommendations(recommendation_engine, gap_analyzer):
     st.header("Recommendations")
@@ -136,9 +310,9 @@ def show_recommendations(recommendation_engine, gap_analyzer):
         return
     
     gaps = st.session_state['gap_analysis']
+    gap_titles = st.session_state['gap_titles']
     
     # Select gap to address
-    gap_titles = [f"Gap {i+1}: {gap['title']}" for i, gap in enumerate(gaps)]
     selected_gap_index = st.selectbox("Select gap to address", range(len(gap_titles)), format_func=lambda x: gap_titles[x])
     
     selected_gap = gaps[selected_gap_index]
@@ -150,7 +324,7 @@ def show_recommendations(recommendation_engine, gap_analyzer):
     
     if st.button("Generate Recommendations"):
         with st.spinner("Generating recommendations..."):
-            recommendations = recommendation_engine.generate_recommendations(selected_gap)
+            recommendations = cached_recommendations(selected_gap, recommendation_engine)
             st.session_state['recommendations'] = recommendations
     
     if 'recommendations' in st.session_state:
@@ -182,20 +356,20 @@ def show_dashboard(doc_processor, gap_analyzer, recommendation_engine):
             gaps = st.session_state['gap_analysis']
             st.metric("Identified Gaps", len(gaps))
             
-            # Count gaps by risk level
-            high_risk = sum(1 for gap in gaps if gap['risk_level'] == 'High')
-            medium_risk = sum(1 for gap in gaps if gap['risk_level'] == 'Medium')
-            low_risk = sum(1 for gap in gaps if gap['risk_level'] == 'Low')
+            # Count gaps by risk level in a single pass; unrecognized levels
+            # count as Medium, matching the gap analyzer's fallback
+            risk_counts = [0, 0, 0]
+            for gap in gaps:
+                risk_counts[RISK_IDX.get(gap['risk_level'], 1)] += 1
             
-            st.metric("High Risk Gaps", high_risk)
-            st.metric("Medium Risk Gaps", medium_risk)
-            st.metric("Low Risk Gaps", low_risk)
+            st.metric("High Risk Gaps", risk_counts[0])
+            st.metric("Medium Risk Gaps", risk_counts[1])
+            st.metric("Low Risk Gaps", risk_counts[2])
     
     st.subheader("Standards Network")
     if hasattr(doc_processor, 'get_standards_network'):
-        network_data = doc_processor.get_standards_network()
-        fig = create_standards_network(network_data)
-        st.pyplot(fig)
+        st.image(render_standards_network(doc_processor.get_document_count(),
+                                          doc_processor.get_section_count(), doc_processor))
     else:
         st.info("Process documents to generate standards network visualization")
     